@@ -8,41 +8,94 @@ A minimal Streamlit interface to demonstrate:
 """
 
 import streamlit as st
-import json
+import orjson
 import os
-from personality_engine import PersonalityEngine, NEUTRAL_PROMPT, PERSONALITIES
-from base_agent import BaseAgent
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from personality_engine import PersonalityEngine, NEUTRAL_PROMPT, PERSONALITY_NAMES, PERSONALITY_TABLE
+from base_agent import BaseAgent, FAST_MODEL, REASONING_MODELS
 from memory_extractor import MemoryExtractor
 
+# Token budget for the baseline response (~600 characters). Reasoning models
+# spend part of max_tokens on reasoning first, so they run at low effort and
+# get extra headroom for it.
+BASELINE_MAX_TOKENS = 200
+BASELINE_REASONING_HEADROOM = 300
+BASELINE_REASONING_EFFORT = "low"
+
+# Appended when the baseline hits its token cap
+TRUNCATION_MARKER = "\n\n*... [response truncated]*"
+
 # Page config
 st.set_page_config(
     page_title="Personality Engine Demo",
     layout="centered"
 )
 
-# Initialize components
+# Initialize components (each cached once per server process)
+@st.cache_resource
+def get_engine():
+    return PersonalityEngine()
+
+@st.cache_resource
+def get_agent():
+    return BaseAgent(temperature=0.7)
+
 @st.cache_resource
-def load_components():
-    engine = PersonalityEngine()
-    agent = BaseAgent(temperature=0.7)
-    return engine, agent
+def get_extractor():
+    return MemoryExtractor()
+
+# Data files are cheap to read and cached in memory only, so regenerated files
+# (e.g. `python memory_extractor.py`) are picked up after a restart
 
-@st.cache_data
+@st.cache_data(show_spinner=False)
 def load_memory():
-    with open("data/user_memory.json", "r") as f:
-        return json.load(f)
+    with open("data/user_memory.json", "rb") as f:
+        return orjson.loads(f.read())
 
-@st.cache_data
+@st.cache_data(show_spinner=False)
 def load_sample_conversation():
-    with open("data/sample_conversation.json", "r") as f:
-        return json.load(f)
+    with open("data/sample_conversation.json", "rb") as f:
+        return orjson.loads(f.read())
 
-@st.cache_data
+@st.cache_data(show_spinner=False)
 def load_test_users():
-    with open("data/test_users.json", "r") as f:
-        return json.load(f)["users"]
-
-engine, agent = load_components()
+    with open("data/test_users.json", "rb") as f:
+        return orjson.loads(f.read())["users"]
+
+# Personality classification runs once per distinct memory
+@st.cache_data(show_spinner=False)
+def classify_memory(memory):
+    return get_engine().select_personality(memory)
+
+# System prompts are assembled once per (personality, memory)
+@st.cache_data(show_spinner=False)
+def cached_build_prompt(personality, memory):
+    return get_engine().build_prompt(personality=personality, memory=memory)
+
+@st.cache_data(show_spinner=False)
+def cached_build_baseline_prompt(memory):
+    return get_engine().build_baseline_prompt(memory=memory)
+
+# (label, user_id) for each test-user button; takes no arguments so the
+# cache lookup does not have to hash the users' conversations
+@st.cache_data(show_spinner=False)
+def build_user_button_specs():
+    return [
+        (f"{PERSONALITY_NAMES[u['expected_personality']]}\n_{u['description']}_", u["id"])
+        for u in load_test_users()
+    ]
+
+# Use cache for extraction (expensive operation); persisted so it survives restarts.
+# Bounded by max_entries only: Streamlit ignores ttl on disk-persisted caches.
+@st.cache_data(persist="disk", show_spinner=False, max_entries=32)
+def extract_user_memory(user_conversation):
+    # Conversation format already matches what extractor expects (turn, role, content)
+    return get_extractor().extract(user_conversation)
+
+engine = get_engine()
+agent = get_agent()
 
 # Title
 st.title("Personality Engine")
@@ -63,7 +116,7 @@ except FileNotFoundError:
 # Show source
 with st.expander("View Source: Sample Conversation (30 messages)"):
     st.markdown("*This memory was extracted from the following conversation:*")
-    for turn in sample_convo.get("conversation", [])[:10]:
+    for turn in islice(sample_convo.get("conversation", ()), 10):
         role = "User" if turn["role"] == "user" else "Assistant"
         st.markdown(f"**{role}:** {turn['content']}")
     st.markdown("*... and 20 more messages*")
@@ -74,7 +127,7 @@ col1, col2, col3 = st.columns(3)
 
 with col1:
     st.subheader("Preferences")
-    for pref in memory.get("preferences", [])[:4]:
+    for pref in islice(memory.get("preferences", ()), 4):
         st.markdown(f"- {pref.get('value', '')}")
 
 with col2:
@@ -104,7 +157,7 @@ st.divider()
 st.header("Personality Classification")
 
 # Classify
-selected_name = engine.select_personality(memory)
+selected_name = classify_memory(memory)
 selected_config = engine.get_personality(selected_name)
 
 # Show result
@@ -128,10 +181,10 @@ with st.expander("Why this personality?"):
 
 # Show all personalities
 with st.expander("All Available Personalities"):
-    for name, config in PERSONALITIES.items():
+    for name, display_name, description in PERSONALITY_TABLE:
         selected_marker = " (selected)" if name == selected_name else ""
-        st.markdown(f"**{config['name']}**{selected_marker}")
-        st.markdown(f"_{config['description']}_")
+        st.markdown(f"**{display_name}**{selected_marker}")
+        st.markdown(f"_{description}_")
         st.markdown("---")
 
 st.divider()
@@ -190,185 +243,218 @@ except FileNotFoundError:
     st.stop()
 
 # Initialize session state for selected user
-if "selected_user_id" not in st.session_state:
-    st.session_state.selected_user_id = None
-
-st.markdown("---")
-st.markdown("### Step 1: Select a Test User")
-st.markdown("**Choose a test user to see how their extracted memory affects responses:**")
-st.caption("Each user has a conversation that reveals their preferences, communication style, and needs")
-
-# Show buttons for each test user
-cols = st.columns(2)
-for i, user in enumerate(test_users):
-    col = cols[i % 2]
-    with col:
-        personality_name = PERSONALITIES[user["expected_personality"]]["name"]
-        button_label = f"{personality_name}\n_{user['description']}_"
-        
-        if st.button(button_label, key=f"user_{user['id']}", use_container_width=True):
-            st.session_state.selected_user_id = user["id"]
-            st.rerun()
-
-# If a user is selected, show their demo
-if st.session_state.selected_user_id:
-    selected_user = next(u for u in test_users if u["id"] == st.session_state.selected_user_id)
-    expected_personality = selected_user["expected_personality"]
-    
+st.session_state.setdefault("selected_user_id", None)
+
+def select_user(user_id):
+    st.session_state.selected_user_id = user_id
+
+# The interactive section runs as a fragment: selecting a user or generating
+# a comparison reruns only this part, not the static sections above
+@st.fragment
+def render_comparison(test_users):
     st.markdown("---")
-    st.markdown("### Step 2: Memory Extraction")
-    st.subheader(f"User: {PERSONALITIES[expected_personality]['name']}")
-    st.markdown(f"*{selected_user['description']}*")
+    st.markdown("### Step 1: Select a Test User")
+    st.markdown("**Choose a test user to see how their extracted memory affects responses:**")
+    st.caption("Each user has a conversation that reveals their preferences, communication style, and needs")
+
+    # Show buttons for each test user
+    cols = st.columns(2)
+    for i, (button_label, user_id) in enumerate(build_user_button_specs()):
+        col = cols[i % 2]
+        with col:
+            # The callback updates state before the fragment reruns, so no explicit rerun is needed
+            st.button(
+                button_label,
+                key=f"user_{user_id}",
+                use_container_width=True,
+                on_click=select_user,
+                args=(user_id,)
+            )
+
+    # If a user is selected, show their demo
+    if st.session_state.selected_user_id:
+        selected_user = next(u for u in test_users if u["id"] == st.session_state.selected_user_id)
+        expected_personality = selected_user["expected_personality"]
     
-    st.info("""
-    **Extracting structured memory from conversation...**
+        st.markdown("---")
+        st.markdown("### Step 2: Memory Extraction")
+        st.subheader(f"User: {PERSONALITY_NAMES[expected_personality]}")
+        st.markdown(f"*{selected_user['description']}*")
     
-    The system analyzes the user's conversation history to identify:
-    - **Preferences**: How they like to communicate, what they value
-    - **Emotional Patterns**: Recurring patterns in their emotional experiences
-    - **Facts**: Stable biographical or contextual information
-    """)
+        st.info("""
+        **Extracting structured memory from conversation...**
     
-    # Use cache for extraction (expensive operation)
-    @st.cache_data
-    def extract_user_memory(user_conversation):
-        extractor = MemoryExtractor()
-        # Conversation format already matches what extractor expects (turn, role, content)
-        return extractor.extract(user_conversation)
+        The system analyzes the user's conversation history to identify:
+        - **Preferences**: How they like to communicate, what they value
+        - **Emotional Patterns**: Recurring patterns in their emotional experiences
+        - **Facts**: Stable biographical or contextual information
+        """)
     
-    try:
-        with st.spinner("Analyzing conversation and extracting memory..."):
-            user_memory = extract_user_memory(selected_user["conversation"])
+        try:
+            # Reruns for the same user (e.g. Generate Comparison) reuse the memory held in
+            # session state and skip hashing the conversation for the cache lookup
+            if st.session_state.get("rendered_user") != selected_user["id"]:
+                with st.spinner("Analyzing conversation and extracting memory..."):
+                    st.session_state.user_memory = extract_user_memory(selected_user["conversation"])
+                st.session_state.rendered_user = selected_user["id"]
+            user_memory = st.session_state.user_memory
         
-        st.success("Memory extracted successfully!")
+            st.success("Memory extracted successfully!")
         
-        # Show extracted memory summary
-        st.markdown("**Extracted Memory Summary:**")
-        with st.expander("View Extracted Memory Details", expanded=False):
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.write("**Preferences**")
-                prefs = user_memory.get("preferences", [])
-                if prefs:
-                    for pref in prefs[:3]:
-                        st.write(f"- {pref.get('value', '')}")
-                    if len(prefs) > 3:
-                        st.caption(f"*... and {len(prefs) - 3} more*")
-                else:
-                    st.caption("*No preferences extracted*")
-            with col2:
-                st.write("**Emotional Patterns**")
-                patterns = user_memory.get("emotional_patterns", [])
-                if patterns:
-                    for pattern in patterns[:2]:
-                        st.write(f"- {pattern.get('value', '')}")
-                    if len(patterns) > 2:
-                        st.caption(f"*... and {len(patterns) - 2} more*")
-                else:
-                    st.caption("*No patterns extracted*")
-            with col3:
-                st.write("**Facts**")
-                facts = user_memory.get("long_term_facts", [])
-                if facts:
-                    for fact in facts[:2]:
-                        st.write(f"- {fact.get('value', '')}")
-                    if len(facts) > 2:
-                        st.caption(f"*... and {len(facts) - 2} more*")
-                else:
-                    st.caption("*No facts extracted*")
+            # Show extracted memory summary
+            st.markdown("**Extracted Memory Summary:**")
+            with st.expander("View Extracted Memory Details", expanded=False):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.write("**Preferences**")
+                    prefs = user_memory.get("preferences", [])
+                    if prefs:
+                        for pref in islice(prefs, 3):
+                            st.write(f"- {pref.get('value', '')}")
+                        if len(prefs) > 3:
+                            st.caption(f"*... and {len(prefs) - 3} more*")
+                    else:
+                        st.caption("*No preferences extracted*")
+                with col2:
+                    st.write("**Emotional Patterns**")
+                    patterns = user_memory.get("emotional_patterns", [])
+                    if patterns:
+                        for pattern in islice(patterns, 2):
+                            st.write(f"- {pattern.get('value', '')}")
+                        if len(patterns) > 2:
+                            st.caption(f"*... and {len(patterns) - 2} more*")
+                    else:
+                        st.caption("*No patterns extracted*")
+                with col3:
+                    st.write("**Facts**")
+                    facts = user_memory.get("long_term_facts", [])
+                    if facts:
+                        for fact in islice(facts, 2):
+                            st.write(f"- {fact.get('value', '')}")
+                        if len(facts) > 2:
+                            st.caption(f"*... and {len(facts) - 2} more*")
+                    else:
+                        st.caption("*No facts extracted*")
         
-        # Show test message
-        test_message = selected_user["test_message"]
-        st.markdown("---")
-        st.markdown("### Step 3: Test Message")
-        st.markdown("**This is the message we'll respond to:**")
-        st.info(f'"{test_message}"')
+            # Show test message
+            test_message = selected_user["test_message"]
+            st.markdown("---")
+            st.markdown("### Step 3: Test Message")
+            st.markdown("**This is the message we'll respond to:**")
+            st.info(f'"{test_message}"')
         
-        st.markdown("---")
-        st.markdown("### Step 4: Generate Comparison")
+            st.markdown("---")
+            st.markdown("### Step 4: Generate Comparison")
         
-        # Generate responses
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            generate_btn = st.button("Generate Comparison", type="primary", use_container_width=True)
+            # Generate responses
+            col1, col2 = st.columns([1, 4])
+            with col1:
+                generate_btn = st.button("Generate Comparison", type="primary", use_container_width=True)
         
-        with col2:
-            st.caption("Click to generate both responses using the same memory but different prompts")
+            with col2:
+                st.caption("Click to generate both responses using the same memory but different prompts")
+                use_fast_baseline = st.toggle(
+                    f"Use {FAST_MODEL} for the baseline",
+                    value=False,
+                    help="Faster, but the two responses then come from different models"
+                )
         
-        if generate_btn:
-            with st.spinner("Generating responses (this may take 10-20 seconds)..."):
-                # Build prompts
-                baseline_prompt = engine.build_baseline_prompt(memory=user_memory)
-                personality_prompt = engine.build_prompt(personality=expected_personality, memory=user_memory)
+            if generate_btn:
+                with st.spinner("Generating responses (this may take 10-20 seconds)..."):
+                    # Build prompts
+                    baseline_prompt = cached_build_baseline_prompt(user_memory)
+                    personality_prompt = cached_build_prompt(expected_personality, user_memory)
+                
+                    # Show what's happening
+                    st.markdown("---")
+                    st.markdown("### Comparison Results")
                 
-                # Show what's happening
-                st.markdown("---")
-                st.markdown("### Comparison Results")
+                    tab1, tab2 = st.tabs(["BEFORE (Baseline)", "AFTER (Personality-Adjusted)"])
                 
-                tab1, tab2 = st.tabs(["BEFORE (Baseline)", "AFTER (Personality-Adjusted)"])
+                    # The personality response is generated in the background while
+                    # the baseline (visible tab) streams in
+                    executor = ThreadPoolExecutor(max_workers=1)
+                    personality_future = executor.submit(agent.respond, test_message, system_prompt=personality_prompt)
                 
-                # BEFORE: Baseline with memory
-                with tab1:
-                    st.markdown("#### Baseline Response: Memory Context Only")
-                    st.caption("""
-                    **Prompt Used:** Neutral prompt ("You are a helpful assistant") + user memory context
+                    try:
+                        # BEFORE: Baseline with memory
+                        with tab1:
+                            st.markdown("#### Baseline Response: Memory Context Only")
+                            baseline_model = FAST_MODEL if use_fast_baseline else agent.model
+                            st.caption(f"""
+                            **Prompt Used:** Neutral prompt ("You are a helpful assistant") + user memory context
+                        
+                            **Model:** {baseline_model}
                     
-                    This response has access to the user's extracted memory (preferences, patterns, facts) 
-                    but no specific instructions on how to communicate. It's a generic assistant that knows 
-                    about the user but responds in a standard helpful way.
-                    """)
+                            This response has access to the user's extracted memory (preferences, patterns, facts) 
+                            but no specific instructions on how to communicate. It's a generic assistant that knows 
+                            about the user but responds in a standard helpful way.
+                            """)
                     
-                    try:
-                        baseline_response = agent.respond(test_message, system_prompt=baseline_prompt)
-                        if len(baseline_response) > 600:
-                            baseline_response = baseline_response[:600] + "\n\n*... [response truncated]*"
-                        st.warning(baseline_response)
+                            try:
+                                # Cap decoding at roughly the old 600-character display limit
+                                st.write_stream(agent.respond_stream(
+                                    test_message,
+                                    system_prompt=baseline_prompt,
+                                    max_tokens=BASELINE_MAX_TOKENS + (
+                                        BASELINE_REASONING_HEADROOM if baseline_model in REASONING_MODELS else 0
+                                    ),
+                                    model=baseline_model,
+                                    reasoning_effort=BASELINE_REASONING_EFFORT,
+                                    truncation_marker=TRUNCATION_MARKER
+                                ))
                         
-                        # Show prompt preview
-                        with st.expander("View Baseline Prompt (for debugging)"):
-                            st.code(baseline_prompt[:500] + "..." if len(baseline_prompt) > 500 else baseline_prompt)
-                    except Exception as e:
-                        st.error(f"Error: {e}")
+                                # Show prompt preview
+                                with st.expander("View Baseline Prompt (for debugging)"):
+                                    st.code(baseline_prompt[:500] + "..." if len(baseline_prompt) > 500 else baseline_prompt)
+                            except Exception as e:
+                                st.error(f"Error: {e}")
                 
-                # AFTER: Personality with memory
-                with tab2:
-                    personality_config = engine.get_personality(expected_personality)
-                    st.markdown(f"#### Personality Response: {personality_config['name']}")
-                    st.caption(f"""
-                    **Prompt Used:** {personality_config['name']} personality instructions + user memory context
+                        # AFTER: Personality with memory
+                        with tab2:
+                            personality_config = engine.get_personality(expected_personality)
+                            st.markdown(f"#### Personality Response: {personality_config['name']}")
+                            st.caption(f"""
+                            **Prompt Used:** {personality_config['name']} personality instructions + user memory context
                     
-                    This response has the same memory context but also follows detailed personality guidelines:
-                    - Communication style and tone
-                    - What to do and what to avoid
-                    - Response structure and length
+                            This response has the same memory context but also follows detailed personality guidelines:
+                            - Communication style and tone
+                            - What to do and what to avoid
+                            - Response structure and length
                     
-                    Notice how the personality instructions transform the response while still respecting the user's memory.
-                    """)
+                            Notice how the personality instructions transform the response while still respecting the user's memory.
+                            """)
                     
-                    try:
-                        personality_response = agent.respond(test_message, system_prompt=personality_prompt)
-                        st.success(personality_response)
+                            try:
+                                personality_response = personality_future.result()
+                                st.success(personality_response)
                         
-                        # Show prompt preview
-                        with st.expander("View Personality Prompt (for debugging)"):
-                            st.code(personality_prompt[:500] + "..." if len(personality_prompt) > 500 else personality_prompt)
-                    except Exception as e:
-                        st.error(f"Error: {e}")
+                                # Show prompt preview
+                                with st.expander("View Personality Prompt (for debugging)"):
+                                    st.code(personality_prompt[:500] + "..." if len(personality_prompt) > 500 else personality_prompt)
+                            except Exception as e:
+                                st.error(f"Error: {e}")
+                    finally:
+                        # Streamlit's rerun/stop exceptions bypass except Exception, so shut down here
+                        executor.shutdown(wait=False)
                 
-                # Key differences
-                st.markdown("---")
-                st.markdown("#### Key Differences")
-                st.info("""
-                **Both responses have access to the same user memory**, but:
-                - **BEFORE**: Generic helpful style, may give advice, standard length
-                - **AFTER**: Follows specific personality rules (e.g., no advice, brief responses, certain tone)
+                    # Key differences
+                    st.markdown("---")
+                    st.markdown("#### Key Differences")
+                    st.info("""
+                    **Both responses have access to the same user memory**, but:
+                    - **BEFORE**: Generic helpful style, may give advice, standard length
+                    - **AFTER**: Follows specific personality rules (e.g., no advice, brief responses, certain tone)
                 
-                The personality instructions act as a "filter" that shapes how the AI responds to the memory context.
-                """)
+                    The personality instructions act as a "filter" that shapes how the AI responds to the memory context.
+                    """)
     
-    except Exception as e:
-        st.error(f"Error extracting memory: {e}")
-        st.exception(e)
+        except Exception as e:
+            st.error(f"Error extracting memory: {e}")
+            st.exception(e)
+
+
+render_comparison(test_users)
 
 st.divider()
 
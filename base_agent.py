@@ -5,15 +5,29 @@ A simple LLM-based agent that accepts a system prompt and generates responses.
 The agent is personality-agnostic - personality is injected via the system prompt.
 """
 
-from groq import Groq
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
+import asyncio
+import httpx
 import os
+from typing import Any, Dict, Iterator, List
 
 load_dotenv()
 
 # Default neutral prompt (no personality)
 NEUTRAL_PROMPT = "You are a helpful assistant."
 
+# Smaller model for responses where speed matters more than quality
+FAST_MODEL = "llama-3.1-8b-instant"
+
+# Models that reason before answering; their reasoning tokens count against
+# max_tokens, and only they accept reasoning_effort
+REASONING_MODELS = {"openai/gpt-oss-20b", "openai/gpt-oss-120b"}
+
+# Connection pool shared by all requests from one agent (HTTP/2, keep-alive)
+HTTP_TIMEOUT = 30.0
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=8, max_connections=16)
+
 
 class BaseAgent:
     """
@@ -25,43 +39,232 @@ class BaseAgent:
     Usage:
         agent = BaseAgent()
         
+        # Or a self-hosted OpenAI-compatible server such as vLLM
+        agent = BaseAgent(model="meta-llama/Llama-3.1-8B-Instruct", base_url="http://localhost:8000/v1")
+        
         # Neutral response
         response = agent.respond("I had a stressful day")
         
         # With custom system prompt (from PersonalityEngine)
         response = agent.respond("I had a stressful day", system_prompt=personality_prompt)
+        
+        # Stream tokens as they are generated
+        for token in agent.respond_stream("I had a stressful day"):
+            print(token, end="")
+        
+        # Same message under several system prompts, sent concurrently
+        neutral, styled = agent.respond_batch("I had a stressful day", [NEUTRAL_PROMPT, personality_prompt])
+        
+        # From async code (call aclose() before the event loop ends)
+        response = await agent.arespond("I had a stressful day", system_prompt=personality_prompt)
+        
+        # Share one connection pool with other clients; arespond uses it and
+        # aclose() leaves it open for its owner to close
+        agent = BaseAgent(async_http_client=shared_http_client)
     """
 
-    def __init__(self, model: str = "openai/gpt-oss-20b", temperature: float = 0.7):
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise RuntimeError("GROQ_API_KEY not found in environment")
+    def __init__(
+        self,
+        model: str = "openai/gpt-oss-20b",
+        temperature: float = 0.7,
+        base_url: str = None,
+        async_http_client: httpx.AsyncClient = None
+    ):
+        if base_url:
+            # Self-hosted OpenAI-compatible server (e.g. vLLM); openai is only needed here
+            from openai import OpenAI, AsyncOpenAI
+            api_key = os.getenv("OPENAI_API_KEY", "EMPTY")
+            client_cls, self._async_client_cls = OpenAI, AsyncOpenAI
+        else:
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                raise RuntimeError("GROQ_API_KEY not found in environment")
+            client_cls, self._async_client_cls = Groq, AsyncGroq
         
-        self.client = Groq(api_key=api_key)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = client_cls(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.Client(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        )
         self.model = model
         self.temperature = temperature
+        self._async_http_client = async_http_client
+        self._aclient = None
 
-    def respond(self, user_message: str, system_prompt: str = None) -> str:
+    def respond(
+        self,
+        user_message: str,
+        system_prompt: str = None,
+        max_tokens: int = None,
+        model: str = None,
+        reasoning_effort: str = None
+    ) -> str:
         """
         Generate a response to the user message.
         
         Args:
             user_message: The user's input message
             system_prompt: Optional system prompt (defaults to neutral)
+            max_tokens: Optional cap on generated tokens; decoding stops server-side
+            model: Optional model override for this call (defaults to self.model)
+            reasoning_effort: Optional "low", "medium" or "high" for reasoning
+                models (ignored for other models); lower leaves more of max_tokens
+                for the visible reply
         
         Returns:
             The agent's response string
         """
-        if system_prompt is None:
-            system_prompt = NEUTRAL_PROMPT
-        
         completion = self.client.chat.completions.create(
-            model=self.model,
-            temperature=self.temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ]
+            **self._completion_kwargs(user_message, system_prompt, max_tokens, model, reasoning_effort)
+        )
+        # content is None when the cap is used up before any visible text
+        return (completion.choices[0].message.content or "").strip()
+
+    def respond_stream(
+        self,
+        user_message: str,
+        system_prompt: str = None,
+        max_tokens: int = None,
+        model: str = None,
+        reasoning_effort: str = None,
+        truncation_marker: str = None
+    ) -> Iterator[str]:
+        """
+        Generate a response to the user message, yielding text as it arrives.
+        
+        Args:
+            user_message: The user's input message
+            system_prompt: Optional system prompt (defaults to neutral)
+            max_tokens: Optional cap on generated tokens; decoding stops server-side
+            model: Optional model override for this call (defaults to self.model)
+            reasoning_effort: Optional "low", "medium" or "high" for reasoning
+                models (ignored for other models); lower leaves more of max_tokens
+                for the visible reply
+            truncation_marker: Optional text yielded last if the reply was cut
+                off by max_tokens
+        
+        Yields:
+            Response text fragments in generation order
+        """
+        stream = self.client.chat.completions.create(
+            **self._completion_kwargs(user_message, system_prompt, max_tokens, model, reasoning_effort),
+            stream=True
+        )
+        finish_reason = None
+        for chunk in stream:
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            yield choice.delta.content or ""
+        if truncation_marker and finish_reason == "length":
+            yield truncation_marker
+
+    async def arespond(
+        self,
+        user_message: str,
+        system_prompt: str = None,
+        max_tokens: int = None,
+        model: str = None,
+        reasoning_effort: str = None
+    ) -> str:
+        """
+        Async version of respond, for dispatching several responses with asyncio.gather.
+        
+        The async client is created on first use and bound to the running event
+        loop; call aclose() before that loop finishes.
+        """
+        if self._aclient is None:
+            self._aclient = self._make_async_client(self._async_http_client)
+        return await self._arespond(
+            self._aclient, user_message, system_prompt, max_tokens, model, reasoning_effort
+        )
+
+    async def aclose(self):
+        """Close the async client used by arespond, if one was created (and not injected)."""
+        if self._aclient is not None:
+            if self._async_http_client is None:
+                await self._aclient.close()
+            self._aclient = None
+
+    def respond_batch(self, user_message: str, system_prompts: List[str]) -> List[str]:
+        """
+        Generate one response per system prompt for the same user message.
+        
+        The requests are sent concurrently, so the batch takes roughly as long
+        as its slowest response rather than the sum of all of them. Against a
+        vLLM server (base_url), continuous batching also coalesces them into
+        shared forward passes. Call it from sync code only; async callers
+        should gather arespond directly.
+        
+        Args:
+            user_message: The user's input message
+            system_prompts: System prompts to answer under (None means neutral)
+        
+        Returns:
+            Response strings in the same order as system_prompts
+        """
+        return asyncio.run(self._respond_batch(user_message, system_prompts))
+
+    async def _respond_batch(self, user_message: str, system_prompts: List[str]) -> List[str]:
+        # The async client is bound to this run's event loop, so close it before the loop ends
+        try:
+            responses = await asyncio.gather(*(
+                self.arespond(user_message, system_prompt=prompt) for prompt in system_prompts
+            ))
+        finally:
+            await self.aclose()
+        return list(responses)
+
+    async def _arespond(
+        self,
+        client,
+        user_message: str,
+        system_prompt: str = None,
+        max_tokens: int = None,
+        model: str = None,
+        reasoning_effort: str = None
+    ) -> str:
+        completion = await client.chat.completions.create(
+            **self._completion_kwargs(user_message, system_prompt, max_tokens, model, reasoning_effort)
         )
-        return completion.choices[0].message.content.strip()
+        # content is None when the cap is used up before any visible text
+        return (completion.choices[0].message.content or "").strip()
 
+    def _make_async_client(self, http_client: httpx.AsyncClient = None):
+        """Create an async client whose requests share one HTTP/2 connection pool."""
+        return self._async_client_cls(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=http_client or httpx.AsyncClient(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        )
+
+    def _completion_kwargs(
+        self,
+        user_message: str,
+        system_prompt: str = None,
+        max_tokens: int = None,
+        model: str = None,
+        reasoning_effort: str = None
+    ) -> Dict[str, Any]:
+        """Request parameters shared by the sync, streaming and async calls."""
+        model = model or self.model
+        kwargs = {
+            "model": model,
+            "temperature": self.temperature,
+            "messages": self._messages(user_message, system_prompt),
+            "max_tokens": max_tokens,
+        }
+        # Other models reject the parameter, so it is only sent where it applies
+        if reasoning_effort is not None and model in REASONING_MODELS:
+            kwargs["reasoning_effort"] = reasoning_effort
+        return kwargs
+
+    def _messages(self, user_message: str, system_prompt: str = None) -> List[Dict[str, str]]:
+        """Build the chat messages, falling back to the neutral system prompt."""
+        if system_prompt is None:
+            system_prompt = NEUTRAL_PROMPT
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
@@ -1,17 +1,191 @@
-from groq import Groq
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
+import argparse
+import asyncio
+import collections
+import hashlib
+import httpx
 import json
+import operator
+import orjson
 import os
-from typing import List, Dict, Any
-from dataclasses import dataclass
+import threading
+import time
+from typing import List, Dict, Any, Optional
 
 load_dotenv()
 
-@dataclass
-class Turn:
-    turn: int
-    role: str
-    content: str
+# Output bucket for each memory type
+MEMORY_BUCKETS = {
+    "preference": "preferences",
+    "emotional_pattern": "emotional_patterns",
+    "long_term_fact": "long_term_facts"
+}
+
+# Fields of a turn dict in the order _format_chunk prints them
+_TURN_FIELDS = operator.itemgetter("turn", "role", "content")
+
+# Batch job statuses after which polling stops
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Structured output schema; the field descriptions carry the extraction criteria
+MEMORY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "memory_candidates": {
+            "type": "array",
+            "description": "Stable, reusable user information from this chunk; empty if there is none",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {
+                        "type": "string",
+                        "enum": list(MEMORY_BUCKETS),
+                        "description": (
+                            "preference: likes, dislikes, tendencies, communication style; "
+                            "emotional_pattern: recurring feelings or cause-effect relationships; "
+                            "long_term_fact: job, living situation, habits, biographical info"
+                        )
+                    },
+                    "key": {
+                        "type": "string",
+                        "description": "Short snake_case label, e.g. exercise_preference, sleep_anxiety_pattern, occupation"
+                    },
+                    "value": {
+                        "type": "string",
+                        "description": "Normalized statement without invented details, e.g. prefers running over gym workouts"
+                    },
+                    "confidence": {
+                        "type": "number",
+                        "description": "0.0-1.0: explicit statements score high, inferences lower"
+                    },
+                    "evidence": {
+                        "type": "object",
+                        "properties": {
+                            "quote": {
+                                "type": "string",
+                                "description": "Exact user quote supporting the memory"
+                            },
+                            "turns": {
+                                "type": "array",
+                                "items": {"type": "integer"},
+                                "description": "Turn numbers the quote comes from"
+                            }
+                        },
+                        "required": ["quote", "turns"],
+                        "additionalProperties": False
+                    },
+                    "source_chunk": {
+                        "type": "integer",
+                        "description": "The chunk_id given with the conversation chunk"
+                    }
+                },
+                "required": ["type", "key", "value", "confidence", "evidence", "source_chunk"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["memory_candidates"],
+    "additionalProperties": False
+}
+
+# Schema for packed requests: one entry of memory candidates per chunk
+PACKED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "description": "One entry per conversation chunk in the request",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk_id": {"type": "integer"},
+                    "memory_candidates": MEMORY_SCHEMA["properties"]["memory_candidates"]
+                },
+                "required": ["chunk_id", "memory_candidates"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+# Packed requests estimated above this many prompt tokens (about 4 characters
+# per token) are sent as separate per-chunk requests instead
+PACKED_PROMPT_TOKEN_LIMIT = 8000
+
+# Models that accept json_schema response formats on Groq; other models reject
+# them, so they get JSON mode with the schema spelled out in the system prompt
+JSON_SCHEMA_MODELS = {
+    "openai/gpt-oss-20b",
+    "openai/gpt-oss-120b",
+    "openai/gpt-oss-safeguard-20b",
+    "moonshotai/kimi-k2-instruct",
+    "moonshotai/kimi-k2-instruct-0905",
+    "meta-llama/llama-4-maverick-17b-128e-instruct",
+    "meta-llama/llama-4-scout-17b-16e-instruct",
+}
+
+# Models among those that enforce the schema strictly (constrained decoding)
+STRICT_SCHEMA_MODELS = {"openai/gpt-oss-20b", "openai/gpt-oss-120b"}
+
+# Connection pool for chunk requests (HTTP/2, keep-alive), sized for the async fan-out
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=64)
+
+class RateLimiter:
+    """
+    Async limiter for requests and estimated tokens per minute.
+
+    Keeps a sliding one-minute window of (time, tokens) for sent requests and
+    makes acquire() wait until a new request fits under both limits. A limit
+    of None is not enforced.
+
+    The tokens counted are the caller's prompt estimates only. Groq's TPM
+    limit also counts completion tokens, so set tpm somewhat below the plan's
+    limit to leave room for the responses.
+
+    The window is guarded by a lock, so one limiter can pace extract() calls
+    running on several threads (each with its own event loop) at once.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        for name, limit in (("rpm", rpm), ("tpm", tpm)):
+            if limit is not None and limit < 1:
+                raise ValueError(f"{name} must be at least 1 (or None for no limit), got {limit}")
+        self.rpm = rpm
+        self.tpm = tpm
+        self._window = collections.deque()
+        self._window_tokens = 0
+        self._lock = threading.Lock()
+
+    async def acquire(self, tokens: int = 0) -> None:
+        if self.rpm is None and self.tpm is None:
+            return
+        while True:
+            # Held only for the check and update (no await inside), so callers
+            # on other threads' loops can't both take the last slot
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._window_tokens -= self._window.popleft()[1]
+
+                fits_rpm = self.rpm is None or len(self._window) < self.rpm
+                # A request larger than the whole budget is let through on an empty window
+                fits_tpm = (
+                    self.tpm is None
+                    or not self._window
+                    or self._window_tokens + tokens <= self.tpm
+                )
+                if fits_rpm and fits_tpm:
+                    self._window.append((now, tokens))
+                    self._window_tokens += tokens
+                    return
+                wait = 60 - (now - self._window[0][0])
+
+            await asyncio.sleep(wait)
+
 
 class MemoryExtractor:
     """
@@ -20,21 +194,66 @@ class MemoryExtractor:
 
     The module accepts a full conversation, internally segments it into coherent
     chunks, and extracts memory candidates from each chunk using a language model.
+    Chunk requests are sent concurrently (at most max_inflight at a time), so
+    extraction takes about as long as the slowest chunk rather than their sum.
+
+    If cache_dir is set, each chunk's parsed result is stored there under a
+    hash of the full request (model, temperature, prompts and chunk text), so
+    re-running on a conversation that only gained new turns calls the LLM for
+    the new chunks only.
+
+    Rate limits (429) and server or connection errors are retried by the Groq
+    client with exponential backoff, up to max_retries times. Set rpm and/or
+    tpm to keep async chunk requests under a plan's per-minute limits
+    instead of running into them (tpm counts estimated prompt tokens only).
+
+    If semantic_threshold is set, memories of the same type whose values have
+    a cosine similarity above it (e.g. "workout_preference" vs
+    "exercise_preference") are merged after the exact-key pass. This needs the
+    optional fastembed and numpy packages.
     """
     def __init__(
         self,
         model: str = "openai/gpt-oss-20b",
         chunk_size: int = 10,
-        temperature: float = 0.0
+        temperature: float = 0.0,
+        max_inflight: int = 8,
+        chunks_per_call: int = 1,
+        max_retries: int = 5,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        async_http_client: Optional[httpx.AsyncClient] = None,
+        cache_dir: Optional[str] = None,
+        semantic_threshold: Optional[float] = None,
+        embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
     ):
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             raise RuntimeError("GROQ_API_KEY not found in environment")
         
-        self.client = Groq(api_key=api_key)
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self.client = Groq(
+            api_key=api_key,
+            max_retries=max_retries,
+            http_client=httpx.Client(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        )
+        # An injected pool (shared with other clients) is used by aextract and left open by aclose
+        self._async_http_client = async_http_client
+        self._aclient = None
         self.model = model
         self.chunk_size = chunk_size
         self.temperature = temperature
+        self.max_inflight = max_inflight
+        self.chunks_per_call = chunks_per_call
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.semantic_threshold = semantic_threshold
+        self.embedding_model = embedding_model
+        self._text_embedder = None
+        self._embeddings: Dict[str, Any] = {}
 
     def extract(
         self,
@@ -55,19 +274,257 @@ class MemoryExtractor:
         Output:
             Dict with keys: preferences, emotional_patterns, long_term_facts
             Each containing a list of deduplicated memory objects.
+
+        Runs the chunk requests on a new event loop, so it can't be called
+        from a thread that is already running one (e.g. Jupyter or async
+        code); await aextract there instead.
         """
-        turns = [Turn(**t) for t in conversation]
-        chunks = self._chunk_conversation(turns)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._extract_once(conversation, output_path))
+        raise RuntimeError(
+            "extract() cannot be called while an event loop is running; "
+            "use 'await extractor.aextract(...)' instead"
+        )
 
-        all_candidates = []
+    async def aextract(
+        self,
+        conversation: List[Dict[str, Any]],
+        output_path: str = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Async version of extract, for callers already running an event loop.
+
+        The async client is created on first use and its connections belong
+        to the loop it is created on; keep all aextract calls on the same loop
+        and call aclose() (or use the extractor as an async context manager)
+        before it ends.
+        """
+        if self._aclient is None:
+            self._aclient = self._make_async_client(self._async_http_client)
+        return await self._aextract(self._aclient, conversation, output_path)
+
+    async def _extract_once(
+        self,
+        conversation: List[Dict[str, Any]],
+        output_path: str = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        # Each sync extract() call runs on a new event loop, so it gets its own
+        # async client instead of reusing a connection pool across loops
+        async with self._make_async_client() as client:
+            return await self._aextract(client, conversation, output_path)
+
+    def close(self) -> None:
+        """Close the sync client's connections."""
+        self.client.close()
+
+    async def aclose(self) -> None:
+        """Close the connections of the clients used by aextract (if one was created) and the sync paths."""
+        if self._aclient is not None:
+            if self._async_http_client is None:
+                await self._aclient.close()
+            self._aclient = None
+        self.client.close()
+
+    async def __aenter__(self) -> "MemoryExtractor":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def _make_async_client(self, http_client: Optional[httpx.AsyncClient] = None) -> AsyncGroq:
+        """Create an async client whose chunk requests share one HTTP/2 connection pool."""
+        return AsyncGroq(
+            api_key=self.api_key,
+            max_retries=self.max_retries,
+            http_client=http_client or httpx.AsyncClient(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        )
 
+    async def _aextract(
+        self,
+        client: AsyncGroq,
+        conversation: List[Dict[str, Any]],
+        output_path: str = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Fan out LLM calls over the chunks and aggregate the results.
+
+        Each call covers chunks_per_call chunks (one by default). Responses
+        are collected in chunk order, so aggregation (and memory IDs) are the
+        same as with sequential extraction.
+        """
+        chunks = self._chunk_conversation(conversation)
+        semaphore = asyncio.Semaphore(self.max_inflight)
+
+        responses: Dict[int, Dict[str, Any]] = {}
+        pending = []
         for chunk_id, chunk_turns in enumerate(chunks, start=1):
             chunk_text = self._format_chunk(chunk_turns)
-            response = self._call_llm(chunk_text, chunk_id)
-            all_candidates.extend(response["memory_candidates"])
+            cached = self._load_cached(self._cache_path(chunk_text, chunk_id))
+            if cached is not None:
+                responses[chunk_id] = cached
+            else:
+                pending.append((chunk_id, chunk_text))
+
+        async def extract_chunk(chunk_id: int, chunk_text: str) -> None:
+            async with semaphore:
+                response = await self._acall_llm(client, chunk_text, chunk_id)
+            self._save_cached(self._cache_path(chunk_text, chunk_id), response)
+            responses[chunk_id] = response
+
+        async def extract_group(group: List[tuple]) -> None:
+            packed = {}
+            if len(group) > 1:
+                async with semaphore:
+                    packed = await self._acall_llm_packed(client, group)
+            for chunk_id, chunk_text in group:
+                if chunk_id in packed:
+                    self._save_cached(self._cache_path(chunk_text, chunk_id), packed[chunk_id])
+                    responses[chunk_id] = packed[chunk_id]
+            # Chunks the packed call skipped or could not cover get their own request
+            await asyncio.gather(*(
+                extract_chunk(chunk_id, chunk_text)
+                for chunk_id, chunk_text in group
+                if chunk_id not in packed
+            ))
+
+        size = max(self.chunks_per_call, 1)
+        await asyncio.gather(*(
+            extract_group(pending[i:i + size])
+            for i in range(0, len(pending), size)
+        ))
+
+        all_candidates = []
+        for chunk_id in sorted(responses):
+            all_candidates.extend(responses[chunk_id]["memory_candidates"])
 
         return self.aggregate_memories(all_candidates, output_path)
 
+    def extract_batched(
+        self,
+        conversation: List[Dict[str, Any]],
+        output_path: str = None,
+        poll_interval: float = 10,
+        timeout: float = 3600
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Extract memory candidates through Groq's Batch API.
+
+        Intended for offline runs where latency does not matter: batch jobs are
+        billed at a discount and do not count against per-minute rate limits.
+        All chunk requests are uploaded as one JSONL file and the job is polled
+        until it finishes. If it fails or is still running after `timeout`
+        seconds, the job is cancelled and extraction falls back to extract().
+        Chunks that failed inside an otherwise completed batch are retried
+        individually.
+
+        Input:
+            conversation, output_path: same as extract()
+            poll_interval: seconds between batch status checks
+            timeout: seconds to wait for the batch before falling back
+
+        Output:
+            Same as extract()
+        """
+        chunk_texts = {
+            chunk_id: self._format_chunk(chunk_turns)
+            for chunk_id, chunk_turns in enumerate(self._chunk_conversation(conversation), start=1)
+        }
+        cache_paths = {
+            chunk_id: self._cache_path(chunk_text, chunk_id)
+            for chunk_id, chunk_text in chunk_texts.items()
+        }
+
+        responses = {}
+        for chunk_id, cache_path in cache_paths.items():
+            cached = self._load_cached(cache_path)
+            if cached is not None:
+                responses[chunk_id] = cached
+
+        pending = [chunk_id for chunk_id in chunk_texts if chunk_id not in responses]
+        if pending:
+            batch_responses = self._run_batch(
+                {chunk_id: chunk_texts[chunk_id] for chunk_id in pending},
+                poll_interval,
+                timeout
+            )
+            if batch_responses is None:
+                return self.extract(conversation, output_path)
+            for chunk_id, response in batch_responses.items():
+                self._save_cached(cache_paths[chunk_id], response)
+            responses.update(batch_responses)
+
+        all_candidates = []
+        for chunk_id, chunk_text in chunk_texts.items():
+            if chunk_id not in responses:
+                responses[chunk_id] = self._call_llm(chunk_text, chunk_id)
+                self._save_cached(cache_paths[chunk_id], responses[chunk_id])
+            all_candidates.extend(responses[chunk_id]["memory_candidates"])
+
+        return self.aggregate_memories(all_candidates, output_path)
+
+    def _run_batch(
+        self,
+        chunk_texts: Dict[int, str],
+        poll_interval: float,
+        timeout: float
+    ) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        Run the given chunks as one batch job.
+
+        Output:
+            Parsed responses keyed by chunk_id (chunks that failed inside the
+            batch are missing), or None if the job did not complete in time.
+        """
+        requests = "\n".join(
+            json.dumps({
+                "custom_id": f"chunk_{chunk_id}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._completion_kwargs(chunk_text, chunk_id),
+            })
+            for chunk_id, chunk_text in chunk_texts.items()
+        )
+
+        batch_file = self.client.files.create(
+            file=("memory_extraction.jsonl", requests.encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+
+        deadline = time.monotonic() + timeout
+        while batch.status not in BATCH_FINAL_STATUSES:
+            if time.monotonic() >= deadline:
+                self.client.batches.cancel(batch.id)
+                print(f"Batch {batch.id} timed out; falling back to direct extraction")
+                return None
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"Batch {batch.id} ended as {batch.status}; falling back to direct extraction")
+            return None
+
+        responses = {}
+        output = self.client.files.content(batch.output_file_id).text()
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                continue
+            chunk_id = int(result["custom_id"].split("_", 1)[1])
+            raw = response["body"]["choices"][0]["message"]["content"]
+            responses[chunk_id] = self._parse_response(raw, chunk_id)
+
+        return responses
+
     def aggregate_memories(
         self,
         candidates: List[Dict[str, Any]],
@@ -90,76 +547,176 @@ class MemoryExtractor:
         Output:
             Dict with keys: preferences, emotional_patterns, long_term_facts
         """
-        from collections import defaultdict
-
-        grouped: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        # Single pass: track the best candidate and merged evidence per (type, key)
+        best_by_key: Dict[tuple, tuple] = {}
+        turns_by_key: Dict[tuple, set] = {}
+        chunks_by_key: Dict[tuple, set] = {}
 
         for mem in candidates:
             group_key = (mem["type"], mem["key"])
-            grouped[group_key].append(mem)
+            confidence = mem.get("confidence", 0.0)
+            current = best_by_key.get(group_key)
+            if current is None:
+                best_by_key[group_key] = (confidence, mem)
+                turns_by_key[group_key] = set()
+                chunks_by_key[group_key] = set()
+            elif confidence > current[0]:
+                # Strictly greater, so the earliest of equally confident candidates wins
+                best_by_key[group_key] = (confidence, mem)
+
+            turns_by_key[group_key].update(mem.get("evidence", {}).get("turns", ()))
+            chunk = mem.get("source_chunk")
+            if chunk is not None:
+                chunks_by_key[group_key].add(chunk)
+
+        if self.semantic_threshold is not None:
+            self._merge_similar(best_by_key, turns_by_key, chunks_by_key)
 
         # Buckets for each memory type
-        buckets = {
-            "preferences": [],
-            "emotional_patterns": [],
-            "long_term_facts": []
-        }
-        
-        id_counter = 1
-
-        for (mem_type, key), mems in grouped.items():
-            # Find the memory with highest confidence
-            best = max(mems, key=lambda m: m.get("confidence", 0.0))
-
-            # Merge all turns from all duplicates
-            all_turns = set()
-            all_chunks = set()
-            for m in mems:
-                all_turns.update(m.get("evidence", {}).get("turns", []))
-                chunk = m.get("source_chunk")
-                if chunk is not None:
-                    all_chunks.add(chunk)
-
-            # Build the aggregated memory with ID
-            result = {
+        buckets = {bucket: [] for bucket in MEMORY_BUCKETS.values()}
+
+        for id_counter, (group_key, (confidence, best)) in enumerate(best_by_key.items(), start=1):
+            mem_type = group_key[0]
+            bucket = MEMORY_BUCKETS.get(mem_type)
+            if bucket is None:
+                continue
+
+            buckets[bucket].append({
                 "id": f"mem_{id_counter}",
                 "type": mem_type,
-                "key": key,
+                "key": best["key"],
                 "value": best["value"],
-                "confidence": best.get("confidence", 0.0),
+                "confidence": confidence,
                 "evidence": {
                     "quote": best.get("evidence", {}).get("quote", ""),
-                    "turns": sorted(all_turns)
+                    "turns": sorted(turns_by_key[group_key])
                 },
-                "source_chunks": sorted(all_chunks)
-            }
-            id_counter += 1
-
-            # Add to appropriate bucket
-            if mem_type == "preference":
-                buckets["preferences"].append(result)
-            elif mem_type == "emotional_pattern":
-                buckets["emotional_patterns"].append(result)
-            elif mem_type == "long_term_fact":
-                buckets["long_term_facts"].append(result)
+                "source_chunks": sorted(chunks_by_key[group_key])
+            })
 
         # Save to file if path provided
         if output_path:
-            with open(output_path, "w") as f:
-                json.dump(buckets, f, indent=2)
+            with open(output_path, "wb") as f:
+                f.write(orjson.dumps(buckets, option=orjson.OPT_INDENT_2))
             print(f"Memories saved to {output_path}")
 
         return buckets
 
-    def _chunk_conversation(self, turns: List[Turn]) -> List[List[Turn]]:
+    def _merge_similar(
+        self,
+        best_by_key: Dict[tuple, tuple],
+        turns_by_key: Dict[tuple, set],
+        chunks_by_key: Dict[tuple, set]
+    ) -> None:
+        """
+        Merge groups of the same type whose values are semantically similar.
+
+        Similar pairs are joined transitively and each merged group is folded
+        into its earliest member: the most confident candidate is kept and
+        turns/chunks are unioned. Merged groups are removed from the dicts in
+        place.
+        """
+        import numpy as np
+
+        keys_by_type: Dict[str, List[tuple]] = {}
+        for group_key in best_by_key:
+            keys_by_type.setdefault(group_key[0], []).append(group_key)
+
+        for group_keys in keys_by_type.values():
+            if len(group_keys) < 2:
+                continue
+
+            values = [best_by_key[k][1]["value"] for k in group_keys]
+            quantized, scales = zip(*self._embed(values))
+            scales = np.asarray(scales, dtype=np.float32)
+            # int8 is only the storage format; dequantize so the pairwise
+            # similarities are one float32 BLAS matmul (integer matmul is not)
+            vectors = np.stack(quantized).astype(np.float32) * (scales[:, None] / 127)
+            sim = vectors @ vectors.T
+            pairs = np.argwhere(np.triu(sim, k=1) > self.semantic_threshold)
+
+            # Union-find with the lowest index as root, so a group keeps its first position
+            parent = list(range(len(group_keys)))
+
+            def find(i: int) -> int:
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+
+            for i, j in pairs.tolist():
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+            for j in range(len(group_keys)):
+                i = find(j)
+                if i == j:
+                    continue
+                keep, drop = group_keys[i], group_keys[j]
+                dropped = best_by_key.pop(drop)
+                if dropped[0] > best_by_key[keep][0]:
+                    best_by_key[keep] = dropped
+                turns_by_key[keep] |= turns_by_key.pop(drop)
+                chunks_by_key[keep] |= chunks_by_key.pop(drop)
+
+    def _embed(self, values: List[str]) -> List[tuple]:
+        """
+        Embed values as (int8 vector, scale) pairs, reusing vectors cached in
+        memory or under cache_dir.
+
+        Vectors are L2-normalized and then quantized per vector, which keeps
+        the cache 4x smaller than float32 while cosine similarities stay
+        within about 0.01.
+        """
+        import numpy as np
+
+        embed_dir = os.path.join(self.cache_dir, "embeddings") if self.cache_dir else None
+        digests = [
+            hashlib.sha256(f"{self.embedding_model}\n{value}".encode()).hexdigest()
+            for value in values
+        ]
+
+        missing: Dict[str, str] = {}
+        for digest, value in zip(digests, values):
+            if digest in self._embeddings or digest in missing:
+                continue
+            path = os.path.join(embed_dir, f"{digest}.npz") if embed_dir else None
+            if path and os.path.exists(path):
+                with np.load(path) as cached:
+                    self._embeddings[digest] = (cached["q"], float(cached["scale"]))
+            else:
+                missing[digest] = value
+
+        if missing:
+            if self._text_embedder is None:
+                from fastembed import TextEmbedding
+                self._text_embedder = TextEmbedding(self.embedding_model)
+            # One batched call for every value not seen before
+            vectors = self._text_embedder.embed(list(missing.values()))
+            for digest, vector in zip(missing, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                vector /= np.linalg.norm(vector)
+                scale = float(np.max(np.abs(vector)))
+                q = np.round(vector / scale * 127).astype(np.int8)
+                self._embeddings[digest] = (q, scale)
+                if embed_dir:
+                    os.makedirs(embed_dir, exist_ok=True)
+                    tmp_path = os.path.join(embed_dir, f"{digest}.{os.getpid()}.tmp.npz")
+                    np.savez(tmp_path, q=q, scale=scale)
+                    os.replace(tmp_path, os.path.join(embed_dir, f"{digest}.npz"))
+
+        return [self._embeddings[digest] for digest in digests]
+
+    def _chunk_conversation(self, turns: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
         """
         Split a conversation into non-overlapping chunks.
 
         Input:
-            turns: List of Turn objects in chronological order.
+            turns: List of turn dicts in chronological order.
 
         Output:
-            A list of chunks, where each chunk is a list of Turn objects.
+            A list of chunks, where each chunk is a list of turn dicts.
             Chunk size is determined by self.chunk_size.
 
         """
@@ -168,13 +725,13 @@ class MemoryExtractor:
             for i in range(0, len(turns), self.chunk_size)
         ]
 
-    def _format_chunk(self, turns: List[Turn]) -> str:
+    def _format_chunk(self, turns: List[Dict[str, Any]]) -> str:
         """
         Convert a chunk of turns into a deterministic text representation
         suitable for LLM consumption.
 
         Input:
-            turns: List of Turn objects belonging to a single chunk.
+            turns: List of turn dicts (turn, role, content) belonging to a single chunk.
 
         Output:
             A formatted string preserving:
@@ -183,10 +740,9 @@ class MemoryExtractor:
                 - original message content
 
         """
-        lines = []
-        for t in turns:
-            lines.append(f"Turn {t.turn} ({t.role}): {t.content}")
-        return "\n".join(lines)
+        return "\n".join(
+            f"Turn {turn} ({role}): {content}" for turn, role, content in map(_TURN_FIELDS, turns)
+        )
 
     def _call_llm(self, chunk_text: str, chunk_id: int) -> Dict[str, Any]:
         """
@@ -200,20 +756,149 @@ class MemoryExtractor:
             A parsed JSON object containing:
                 - memory_candidates: list of extracted memory items
         """
-
         completion = self.client.chat.completions.create(
-            model=self.model,
-            temperature=self.temperature,
-            messages=[
-                {"role": "system", "content": self._system_prompt()},
+            **self._completion_kwargs(chunk_text, chunk_id)
+        )
+        return self._parse_response(completion.choices[0].message.content, chunk_id)
+
+    async def _acall_llm(
+        self,
+        client: AsyncGroq,
+        chunk_text: str,
+        chunk_id: int
+    ) -> Dict[str, Any]:
+        """Async version of _call_llm using the given async client."""
+        request = self._completion_kwargs(chunk_text, chunk_id)
+        await self.rate_limiter.acquire(self._estimate_tokens(request["messages"]))
+        completion = await client.chat.completions.create(**request)
+        return self._parse_response(completion.choices[0].message.content, chunk_id)
+
+    async def _acall_llm_packed(
+        self,
+        client: AsyncGroq,
+        group: List[tuple]
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Extract memory from several chunks in one request.
+
+        Input:
+            group: (chunk_id, chunk_text) pairs
+
+        Output:
+            Dict mapping chunk_id to its parsed response. Empty if the request
+            would be too long or the output can't be parsed; chunks missing
+            from the result should be extracted one by one.
+        """
+        messages = [
+            {"role": "system", "content": self._system_prompt()},
+            *(
+                {"role": "user", "content": self._user_prompt(chunk_text, chunk_id)}
+                for chunk_id, chunk_text in group
+            ),
+            {
+                "role": "user",
+                "content": "Extract memory candidates from each chunk above separately and "
+                           "return one entry per chunk_id in results.",
+            },
+        ]
+        request = self._request_kwargs(messages, PACKED_SCHEMA, "packed_memory_candidates")
+        prompt_tokens = self._estimate_tokens(request["messages"])
+        if prompt_tokens > PACKED_PROMPT_TOKEN_LIMIT:
+            return {}
+
+        await self.rate_limiter.acquire(prompt_tokens)
+        completion = await client.chat.completions.create(**request)
+        try:
+            results = json.loads(completion.choices[0].message.content)["results"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return {}
+
+        chunk_ids = {chunk_id for chunk_id, _ in group}
+        return {
+            result["chunk_id"]: {"memory_candidates": result["memory_candidates"]}
+            for result in results
+            if result.get("chunk_id") in chunk_ids and "memory_candidates" in result
+        }
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Rough prompt token count (about 4 characters per token)."""
+        return sum(len(message["content"]) for message in messages) // 4
+
+    def _completion_kwargs(self, chunk_text: str, chunk_id: int) -> Dict[str, Any]:
+        """Request parameters for extracting memory from one chunk."""
+        messages = [
+            {"role": "system", "content": self._system_prompt()},
+            {"role": "user", "content": self._user_prompt(chunk_text, chunk_id)},
+        ]
+        return self._request_kwargs(messages, MEMORY_SCHEMA, "memory_candidates")
+
+    def _request_kwargs(
+        self,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        name: str
+    ) -> Dict[str, Any]:
+        """Request parameters shared by single-chunk and packed extraction calls."""
+        if self.model in JSON_SCHEMA_MODELS:
+            # Structured outputs: the response follows the given schema
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": name,
+                    "schema": schema,
+                    "strict": self.model in STRICT_SCHEMA_MODELS,
+                },
+            }
+        else:
+            # JSON mode only guarantees valid JSON, so the schema goes in the prompt
+            system, *rest = messages
+            messages = [
                 {
-                    "role": "user",
-                    "content": self._user_prompt(chunk_text, chunk_id),
+                    "role": "system",
+                    "content": f"{system['content']}\n\nRespond with a JSON object that follows "
+                               f"this JSON schema:\n{json.dumps(schema)}",
                 },
-            ],
-        )
-        raw = completion.choices[0].message.content
-        # print(raw)
+                *rest,
+            ]
+            response_format = {"type": "json_object"}
+
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "messages": messages,
+            "response_format": response_format,
+        }
+
+    def _cache_path(self, chunk_text: str, chunk_id: int) -> Optional[str]:
+        """
+        Location of the cached result for a chunk, or None if caching is off.
+
+        The key hashes the complete request, so changing the model, the
+        temperature or either prompt invalidates earlier entries.
+        """
+        if not self.cache_dir:
+            return None
+        request = json.dumps(self._completion_kwargs(chunk_text, chunk_id), sort_keys=True)
+        key = hashlib.sha256(request.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_cached(self, cache_path: Optional[str]) -> Optional[Dict[str, Any]]:
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+        with open(cache_path, "r") as f:
+            return json.load(f)
+
+    def _save_cached(self, cache_path: Optional[str], response: Dict[str, Any]):
+        if cache_path is None:
+            return
+        # Write to a temp file and rename so readers never see a partial entry
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(response, f)
+        os.replace(tmp_path, cache_path)
+
+    def _parse_response(self, raw: str, chunk_id: int) -> Dict[str, Any]:
+        """Parse the model's JSON output for a chunk (structured outputs make failures rare)."""
         try:
             return json.loads(raw)
         except json.JSONDecodeError:
@@ -249,84 +934,35 @@ CONFIDENCE SCORING:
 - 0.9-1.0: Explicit, direct statement ("I prefer X", "I am Y")
 - 0.7-0.8: Strongly implied, clear from context
 - 0.5-0.6: Inferred from behavior or indirect statement
-- Below 0.5: Uncertain, ambiguous, or speculative
-
-Output ONLY valid JSON. No explanations or commentary."""
+- Below 0.5: Uncertain, ambiguous, or speculative"""
 
     def _user_prompt(self, chunk_text: str, chunk_id: int) -> str:
         return f"""Conversation chunk (chunk_id={chunk_id}):
 
 {chunk_text}
 
-TASK: Extract memory candidates using the following reasoning process.
-
-STEP 1 - IDENTIFY CANDIDATE STATEMENTS
-Read through the conversation and identify any user statements that reveal:
-- Preferences (likes, dislikes, tendencies, communication style)
-- Emotional patterns (recurring feelings, cause-effect relationships)
-- Long-term facts (job, living situation, habits, biographical info)
-
-STEP 2 - EVALUATE EACH CANDIDATE
-For each candidate, ask:
-- Is this stable information that will remain relevant in future conversations?
-- Is this explicitly stated or clearly implied?
-- Can I extract this without inventing details?
-- What exact quote supports this, and from which turn(s)?
-
-STEP 3 - CLASSIFY AND STRUCTURE
-Determine:
-- Type: preference | emotional_pattern | long_term_fact
-- Key: A short descriptive label (e.g., "exercise_preference", "sleep_anxiety_pattern")
-- Value: Normalized statement of the memory (e.g., "prefers running over gym")
-- Confidence: 0.0-1.0 based on explicitness and clarity
-- Evidence: Direct quote and turn number(s)
-
-STEP 4 - OUTPUT FORMAT
-Return a JSON object with this exact structure:
-
-{{
-  "memory_candidates": [
-    {{
-      "type": "preference|emotional_pattern|long_term_fact",
-      "key": "descriptive_key_name",
-      "value": "normalized statement of the memory",
-      "confidence": 0.0,
-      "evidence": {{
-        "quote": "exact quote from conversation",
-        "turns": [turn_number]
-      }},
-      "source_chunk": {chunk_id}
-    }}
-  ]
-}}
-
-EXAMPLES:
-
-User says: "I prefer running over going to the gym"
-→ Type: preference
-→ Key: exercise_preference
-→ Value: prefers running over gym workouts
-→ Confidence: 0.95 (explicit statement)
-→ Quote: "I prefer running over going to the gym"
-
-User says: "my sleep gets messed up and I feel anxious the next day"
-→ Type: emotional_pattern
-→ Key: sleep_anxiety_pattern
-→ Value: sleep disruption leads to next-day anxiety
-→ Confidence: 0.85 (clear causal relationship)
-→ Quote: "my sleep gets messed up and I feel anxious the next day"
-
-User says: "I'm a software engineer"
-→ Type: long_term_fact
-→ Key: occupation
-→ Value: software engineer
-→ Confidence: 1.0 (direct factual statement)
-→ Quote: "I'm a software engineer"
-
-Now extract memory candidates from the conversation chunk above.
-Return ONLY the JSON output, no other text."""
-    
+Return a JSON object matching the provided schema with all memory candidates you extract. Only extract stable, reusable info."""
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract user memory from the sample conversation")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit chunks as a Groq batch job (cheaper, but may take much longer)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Cache per-chunk results here so unchanged chunks are not re-extracted"
+    )
+    parser.add_argument(
+        "--semantic-threshold",
+        type=float,
+        default=None,
+        help="Merge same-type memories above this cosine similarity, e.g. 0.85 (needs fastembed)"
+    )
+    args = parser.parse_args()
+
     sample_convo_path = "data/sample_conversation.json"
     output_path = "data/user_memory.json"
 
@@ -337,12 +973,17 @@ if __name__ == "__main__":
     extractor = MemoryExtractor(
         model="openai/gpt-oss-20b",
         chunk_size=10,
-        temperature=0.0
+        temperature=0.0,
+        cache_dir=args.cache_dir,
+        semantic_threshold=args.semantic_threshold
     )
 
     print("Running memory extraction...\n")
 
-    memories = extractor.extract(total_conversation, output_path=output_path)
+    if args.batch:
+        memories = extractor.extract_batched(total_conversation, output_path=output_path)
+    else:
+        memories = extractor.extract(total_conversation, output_path=output_path)
 
     total_count = (
         len(memories["preferences"]) +
@@ -5,8 +5,11 @@ Designs system prompts based on predefined personality types.
 Each personality has a complete prompt template that defines its behavior.
 """
 
-from typing import Dict, Any, Optional
-import json
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import orjson
+import re
 
 
 # Predefined personality prompts - each is a complete system prompt
@@ -136,6 +139,168 @@ Grounded and direct. Your purpose is to help someone take one small, concrete st
     }
 }
 
+# Display names keyed by personality, computed once at import
+PERSONALITY_NAMES: Dict[str, str] = {
+    key: config["name"] for key, config in PERSONALITIES.items()
+}
+
+# (key, display name, description) rows for listing every personality
+PERSONALITY_TABLE: List[Tuple[str, str, str]] = [
+    (key, config["name"], config["description"]) for key, config in PERSONALITIES.items()
+]
+
+
+# --- Personality selection signals ---
+# Phrases looked for in preference keys/values. Matching is plain substring
+# matching (like `phrase in text`); the lookahead lets one regex scan report
+# every phrase present, including overlapping ones ("myself" contains "self").
+_SIGNAL_PHRASES = [
+    "listen", "calm", "steady", "presence", "coach", "cheerful", "fake", "toxic",
+    "practical", "action", "direct", "structure", "system", "give me", "step",
+    "solution", "what can i do", "what to do", "thought", "pattern", "understand",
+    "self", "why", "curious", "explore", "not", "don't",
+]
+_SIGNAL_PATTERN = re.compile("(?=(" + ")|(".join(map(re.escape, _SIGNAL_PHRASES)) + "))")
+_PHRASE_BITS = {phrase: 1 << i for i, phrase in enumerate(_SIGNAL_PHRASES)}
+
+
+def _phrases(*phrases: str) -> int:
+    """Bitmask covering the given phrases."""
+    mask = 0
+    for phrase in phrases:
+        mask |= _PHRASE_BITS[phrase]
+    return mask
+
+
+def _phrase_flags(text: str) -> int:
+    """Bitmask of the signal phrases found in text, in a single scan."""
+    flags = 0
+    for match in _SIGNAL_PATTERN.finditer(text):
+        flags |= 1 << (match.lastindex - 1)
+    return flags
+
+
+_NOT = _phrases("not")
+_NEGATED = _phrases("not", "don't")
+_LISTEN = _phrases("listen")
+_CALM = _phrases("calm")
+_STEADY_PRESENCE = _phrases("steady", "presence")
+_COACH = _phrases("coach")
+_CHEERFUL = _phrases("cheerful", "fake", "toxic")
+_PRACTICAL = _phrases("practical", "action")
+_DIRECT = _phrases("direct")
+_STRUCTURE = _phrases("structure", "system")
+_GIVE_ME = _phrases("give me")
+_STEP_OR_SOLUTION = _phrases("step", "solution")
+_WHAT_TO_DO = _phrases("what can i do", "what to do")
+_THOUGHTS = _phrases("thought", "pattern")
+_UNDERSTAND = _phrases("understand")
+_SELF_OR_WHY = _phrases("self", "why")
+_CURIOUS = _phrases("curious", "explore")
+
+# User-level signals derived from memory
+_WANTS_LISTENING = 1 << 0
+_WANTS_CALM = 1 << 1
+_DISLIKES_CHEERFUL = 1 << 2
+_WANTS_STEADY_PRESENCE = 1 << 3
+_WANTS_PRACTICAL = 1 << 4
+_WANTS_DIRECT = 1 << 5
+_WANTS_REFLECTION = 1 << 6
+_MENTIONS_THOUGHTS = 1 << 7
+_HAS_ANXIETY = 1 << 8
+_SIGNAL_COUNT = 9
+
+
+def _preference_signals(key_flags: int, value_flags: int) -> int:
+    """User-level signals expressed by one preference."""
+    either = key_flags | value_flags
+    value = value_flags
+    signals = 0
+    
+    # Supportive Listener signals
+    if either & _LISTEN:
+        signals |= _WANTS_LISTENING
+    if either & _CALM:
+        signals |= _WANTS_CALM
+    if value & _STEADY_PRESENCE or (value & _COACH and value & _NEGATED):
+        signals |= _WANTS_STEADY_PRESENCE
+    
+    # Grounding Presence signals
+    if value & _CHEERFUL:
+        signals |= _DISLIKES_CHEERFUL
+    
+    # Practical Mentor signals (be careful about negations)
+    # Only trigger if they WANT practical, not if they say "don't need solutions"
+    if value & _PRACTICAL and not value & _NEGATED:
+        signals |= _WANTS_PRACTICAL
+    if key_flags & _DIRECT or (value & _DIRECT and not value & _NOT):
+        signals |= _WANTS_DIRECT
+    if value & _STRUCTURE and not value & _NOT:
+        signals |= _WANTS_PRACTICAL
+    # Explicit signals that they want practical help
+    if (value & _GIVE_ME and value & _STEP_OR_SOLUTION) or value & _WHAT_TO_DO:
+        signals |= _WANTS_PRACTICAL
+    
+    # CBT-Reflective Guide signals
+    if either & _THOUGHTS:
+        signals |= _MENTIONS_THOUGHTS
+    if (value & _UNDERSTAND and value & _SELF_OR_WHY) or value & _CURIOUS:
+        signals |= _WANTS_REFLECTION
+    
+    return signals
+
+
+def _personality_for_signals(signals: int) -> str:
+    """Selection logic (order matters - more specific first)."""
+    # Practical Mentor: wants action, solutions, direct communication
+    if signals & _WANTS_PRACTICAL or (signals & _WANTS_DIRECT and not signals & _WANTS_LISTENING):
+        return "practical_mentor"
+    
+    # CBT-Reflective Guide: introspective, curious about thought patterns
+    if signals & (_MENTIONS_THOUGHTS | _WANTS_REFLECTION):
+        return "cbt_reflective_guide"
+    
+    # Grounding Presence: anxious + dislikes cheerful advice
+    if signals & _DISLIKES_CHEERFUL and signals & _HAS_ANXIETY:
+        return "grounding_presence"
+    
+    # Supportive Listener: wants to be heard
+    if signals & (_WANTS_LISTENING | _WANTS_STEADY_PRESENCE):
+        return "supportive_listener"
+    
+    # Grounding Presence: has anxiety (even without dislikes cheerful)
+    if signals & _HAS_ANXIETY and signals & _WANTS_CALM:
+        return "grounding_presence"
+    
+    # Default
+    return "supportive_listener"
+
+
+# Every combination of signals resolved once, so selection is a table lookup
+_SELECTION_TABLE: Tuple[str, ...] = tuple(
+    _personality_for_signals(signals) for signals in range(1 << _SIGNAL_COUNT)
+)
+
+
+@lru_cache(maxsize=256)
+def _memory_context(preference_values: Tuple[str, ...], pattern_values: Tuple[str, ...]) -> str:
+    """User context section for a prompt, built once per distinct set of values."""
+    context_parts = ["\n## User Context (from memory)"]
+    
+    # Add relevant preferences
+    if preference_values:
+        context_parts.append("User preferences to respect:")
+        for value in preference_values:
+            context_parts.append(f"- {value}")
+    
+    # Add emotional patterns
+    if pattern_values:
+        context_parts.append("Known emotional patterns:")
+        for value in pattern_values:
+            context_parts.append(f"- {value}")
+    
+    return "\n".join(context_parts)
+
 
 class PersonalityEngine:
     """
@@ -153,11 +318,15 @@ class PersonalityEngine:
     
     def __init__(self):
         self.personalities = PERSONALITIES
+        # Prompt templates resolved once, so building a prompt is a single lookup
+        self._prompts: Dict[str, str] = {
+            name: config["prompt"] for name, config in self.personalities.items()
+        }
     
     def load_memory(self, memory_path: str) -> Dict[str, Any]:
         """Load user memory from JSON file."""
-        with open(memory_path, "r") as f:
-            return json.load(f)
+        with open(memory_path, "rb") as f:
+            return orjson.loads(f.read())
     
     def select_personality(self, memory: Dict[str, Any]) -> str:
         """
@@ -175,89 +344,23 @@ class PersonalityEngine:
         preferences = memory.get("preferences", [])
         emotional_patterns = memory.get("emotional_patterns", [])
         
-        # Extract preference signals
-        wants_listening = False
-        wants_calm = False
-        dislikes_cheerful = False
-        wants_steady_presence = False
-        wants_practical = False
-        wants_direct = False
-        wants_reflection = False
-        mentions_thoughts = False
-        
+        # Each key and value is scanned once for all signal phrases
+        signals = 0
         for pref in preferences:
-            key = pref.get("key", "").lower()
-            value = pref.get("value", "").lower()
-            
-            # Supportive Listener signals
-            if "listen" in key or "listen" in value:
-                wants_listening = True
-            if "calm" in key or "calm" in value:
-                wants_calm = True
-            if "steady" in value or "presence" in value:
-                wants_steady_presence = True
-            if "coach" in value and ("not" in value or "don't" in value):
-                wants_steady_presence = True
-            
-            # Grounding Presence signals
-            if "cheerful" in value or "fake" in value or "toxic" in value:
-                dislikes_cheerful = True
-            
-            # Practical Mentor signals (be careful about negations)
-            # Only trigger if they WANT practical, not if they say "don't need solutions"
-            if ("practical" in value or "action" in value) and "not" not in value and "don't" not in value:
-                wants_practical = True
-            if "direct" in key or ("direct" in value and "not" not in value):
-                wants_direct = True
-            if ("structure" in value or "system" in value) and "not" not in value:
-                wants_practical = True
-            # Explicit signals that they want practical help
-            if "give me" in value and ("step" in value or "solution" in value):
-                wants_practical = True
-            if "what can i do" in value or "what to do" in value:
-                wants_practical = True
-            
-            # CBT-Reflective Guide signals
-            if "thought" in key or "thought" in value:
-                mentions_thoughts = True
-            if "pattern" in key or "pattern" in value:
-                mentions_thoughts = True
-            if "understand" in value and ("self" in value or "myself" in value or "why" in value):
-                wants_reflection = True
-            if "curious" in value or "explore" in value:
-                wants_reflection = True
+            signals |= _preference_signals(
+                _phrase_flags(pref.get("key", "").lower()),
+                _phrase_flags(pref.get("value", "").lower())
+            )
         
         # Check for anxiety/stress patterns
-        has_anxiety = any(
+        if any(
             "anxiety" in p.get("key", "").lower() or 
             "stress" in p.get("value", "").lower()
             for p in emotional_patterns
-        )
-        
-        # Selection logic (order matters - more specific first)
-        
-        # Practical Mentor: wants action, solutions, direct communication
-        if wants_practical or (wants_direct and not wants_listening):
-            return "practical_mentor"
-        
-        # CBT-Reflective Guide: introspective, curious about thought patterns
-        if mentions_thoughts or wants_reflection:
-            return "cbt_reflective_guide"
-        
-        # Grounding Presence: anxious + dislikes cheerful advice
-        if dislikes_cheerful and has_anxiety:
-            return "grounding_presence"
-        
-        # Supportive Listener: wants to be heard
-        if wants_listening or wants_steady_presence:
-            return "supportive_listener"
+        ):
+            signals |= _HAS_ANXIETY
         
-        # Grounding Presence: has anxiety (even without dislikes cheerful)
-        if has_anxiety and wants_calm:
-            return "grounding_presence"
-        
-        # Default
-        return "supportive_listener"
+        return _SELECTION_TABLE[signals]
     
     def build_prompt(
         self,
@@ -289,7 +392,7 @@ class PersonalityEngine:
             selected = "supportive_listener"
         
         # Get the prompt template
-        prompt = self.personalities[selected]["prompt"]
+        prompt = self._prompts[selected]
         
         # Optionally append user context from memory
         if memory:
@@ -299,23 +402,11 @@ class PersonalityEngine:
     
     def _add_memory_context(self, memory: Dict[str, Any]) -> str:
         """Append user-specific context from memory to the prompt."""
-        context_parts = ["\n## User Context (from memory)"]
-        
-        # Add relevant preferences
-        prefs = memory.get("preferences", [])[:3]
-        if prefs:
-            context_parts.append("User preferences to respect:")
-            for p in prefs:
-                context_parts.append(f"- {p.get('value', '')}")
-        
-        # Add emotional patterns
-        patterns = memory.get("emotional_patterns", [])[:2]
-        if patterns:
-            context_parts.append("Known emotional patterns:")
-            for p in patterns:
-                context_parts.append(f"- {p.get('value', '')}")
-        
-        return "\n".join(context_parts)
+        # Only the first few values reach the prompt, so they are the cache key
+        return _memory_context(
+            tuple(p.get("value", "") for p in memory.get("preferences", [])[:3]),
+            tuple(p.get("value", "") for p in memory.get("emotional_patterns", [])[:2])
+        )
     
     def build_baseline_prompt(self, memory: Optional[Dict[str, Any]] = None, memory_path: Optional[str] = None) -> str:
         """
@@ -360,6 +451,17 @@ class PersonalityEngine:
 NEUTRAL_PROMPT = "You are a helpful assistant."
 
 
+async def _generate_responses(agent, messages: List[str], system_prompts: List[str]) -> List[List[str]]:
+    """Generate a response for every (message, system prompt) pair concurrently."""
+    try:
+        return await asyncio.gather(*(
+            asyncio.gather(*(agent.arespond(msg, system_prompt=prompt) for prompt in system_prompts))
+            for msg in messages
+        ))
+    finally:
+        await agent.aclose()
+
+
 def run_demo():
     """
     Before/After Demo: Classify personality from memory, then show comparison.
@@ -405,7 +507,10 @@ def run_demo():
     
     print(f"\n[STEP 3] Before/After Comparison")
     
-    for msg in test_messages:
+    # Generate all before/after responses concurrently
+    responses = asyncio.run(_generate_responses(agent, test_messages, [NEUTRAL_PROMPT, prompt]))
+    
+    for msg, (before, after) in zip(test_messages, responses):
         print(f"\n{'=' * 70}")
         print(f"User: \"{msg}\"")
         print("=" * 70)
@@ -413,12 +518,12 @@ def run_demo():
         # Before: Neutral
         print("\n[BEFORE] Neutral (no personality)")
         print("-" * 50)
-        print(agent.respond(msg, system_prompt=NEUTRAL_PROMPT))
+        print(before)
         
         # After: Selected personality only
         print(f"\n[AFTER] {selected_config['name']}")
         print("-" * 50)
-        print(agent.respond(msg, system_prompt=prompt))
+        print(after)
     
     print("\n" + "=" * 70)
     print("Demo complete.")
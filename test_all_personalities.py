@@ -5,106 +5,395 @@ Extracts memories for different user types and tests that each
 triggers the expected personality classification.
 """
 
-import json
-from memory_extractor import MemoryExtractor
-from personality_engine import PersonalityEngine, NEUTRAL_PROMPT
-from base_agent import BaseAgent
+import argparse
+import asyncio
+import hashlib
+import orjson
+import os
+import sys
+from personality_engine import PersonalityEngine, NEUTRAL_PROMPT, PERSONALITY_NAMES
 
+# memory_extractor, base_agent and httpx (which pull in the Groq SDK) are
+# imported where the clients are created, so --help and --list-users start fast
+
+try:
+    import uvloop
+    # uvloop.run only exists from uvloop 0.18 on
+    run_async = getattr(uvloop, "run", asyncio.run)
+except ImportError:  # optional speedup; the default asyncio loop runs the same code
+    run_async = asyncio.run
+
+TEST_USERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "test_users.json")
+
+# Users processed at the same time (each user's extraction fans out further)
+CONCURRENCY = 5
+
+# The neutral reply is only shown truncated to 300 characters (about 100 tokens),
+# so generation is capped server-side instead of discarding the rest. The
+# default model reasons first and those tokens count against the cap, so it
+# runs at low reasoning effort with headroom on top of the visible reply.
+NEUTRAL_MAX_TOKENS = 100 + 300
+NEUTRAL_REASONING_EFFORT = "low"
+
+# Large enough for a reasoning model to get past its reasoning and return
+# some text; the warm-up reply itself is discarded
+WARMUP_MAX_TOKENS = 64
+
+# One keep-alive pool shared by the extractor and the agent for all calls
+HTTP_MAX_CONNECTIONS = 16
+HTTP_TIMEOUT = 60.0
+HTTP_CONNECT_TIMEOUT = 5.0
+
+# One JSON line per user: classification result plus the generated responses
+RESULTS_PATH = "results.jsonl"
+
+# Per-chunk extraction results, keyed by the full request, so re-runs only
+# call the LLM for chunks (or prompts and settings) not seen before
+EXTRACT_CACHE_DIR = ".cache/extract"
+
+
+def _respond(agent, message, system_prompt, options, max_tokens=None, reasoning_effort=None):
+    """
+    Start agent.arespond as a task, shared between identical requests when
+    options["response_cache"] is set.
+
+    The cache stores tasks rather than strings, so concurrent users with the
+    same (system prompt, message) wait on one LLM call instead of racing.
+    """
+    cache = options["response_cache"]
+    if cache is None:
+        return asyncio.ensure_future(agent.arespond(
+            message, system_prompt=system_prompt, max_tokens=max_tokens, reasoning_effort=reasoning_effort
+        ))
+
+    key = (hashlib.blake2b(system_prompt.encode("utf-8"), digest_size=16).digest(), message, max_tokens, reasoning_effort)
+    if key not in cache:
+        cache[key] = asyncio.ensure_future(
+            agent.arespond(message, system_prompt=system_prompt, max_tokens=max_tokens, reasoning_effort=reasoning_effort)
+        )
+    return cache[key]
+
+
+def _discard(task, options):
+    """
+    Let go of a response task this user no longer waits on.
+
+    A pending task is cancelled unless it is shared through the response
+    cache (another user may still await it; _run_all drains the rest). A
+    finished one has its exception retrieved so asyncio doesn't warn about it.
+    """
+    if task is None:
+        return
+    if not task.done():
+        if options["response_cache"] is None:
+            task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
+def render_user(user, memories, selected, neutral, styled, error=None) -> str:
+    """
+    Render one user's report block.
+
+    memories and selected are None if extraction failed (error says why);
+    neutral and styled are None when those responses were not generated or
+    failed (error says why).
+    """
+    lines = [
+        f"\n{'=' * 70}",
+        f"USER: {user['id']}",
+        f"Description: {user['description']}",
+        f"Expected Personality: {user['expected_personality']}",
+        "=" * 70,
+        "\n[1] Extracting memories...",
+    ]
+
+    if memories is None:
+        lines.append(f"    Error extracting memories: {error}")
+        return "\n".join(lines) + "\n"
+
+    pref_count = len(memories.get("preferences", []))
+    pattern_count = len(memories.get("emotional_patterns", []))
+    fact_count = len(memories.get("long_term_facts", []))
+    lines.append(f"    Extracted: {pref_count} preferences, {pattern_count} patterns, {fact_count} facts")
+
+    # Step 2: Classification
+    name = PERSONALITY_NAMES[selected]
+    match = "✓ MATCH" if selected == user["expected_personality"] else "✗ MISMATCH"
+    lines.append("\n[2] Classifying personality...")
+    lines.append(f"    Selected: {name} {match}")
+
+    # Step 3: Responses
+    if error is not None:
+        lines.append(f"\n    Error generating responses: {error}")
+    elif styled is not None:
+        lines.append(f"\n[3] Test Message: \"{user['test_message']}\"")
+
+        if neutral is not None:
+            lines.append("\n    [NEUTRAL]")
+            # Truncate if too long
+            if len(neutral) > 300:
+                neutral = neutral[:300] + "..."
+            lines.append(f"    {neutral}")
+
+        lines.append(f"\n    [{name.upper()}]")
+        lines.append(f"    {styled}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def _run_user(user, extractor, engine, agent, semaphore, options):
+    """
+    Extract, classify and respond for one user.
+
+    Returns (result, report): the result record and the user's rendered
+    report if options["pretty"] is set (else None). The record carries the
+    error if extraction or a response failed after the client's own retries;
+    selected is None if extraction failed. Reports are written after all
+    users finish so concurrent users don't interleave their output.
+    """
+    test_message = user["test_message"]
+    neutral = styled = None
+
+    async with semaphore:
+        # The neutral response doesn't depend on memory, so it runs alongside extraction
+        neutral_task = None
+        if options["neutral"]:
+            neutral_task = _respond(
+                agent, test_message, NEUTRAL_PROMPT, options,
+                max_tokens=NEUTRAL_MAX_TOKENS, reasoning_effort=NEUTRAL_REASONING_EFFORT
+            )
 
-def run_test():
-    """Test all personality types with different user profiles."""
-    
-    # Load test users
-    with open("data/test_users.json", "r") as f:
-        data = json.load(f)
-    
-    extractor = MemoryExtractor(chunk_size=10, temperature=0.0)
-    engine = PersonalityEngine()
-    agent = BaseAgent(temperature=0.7)
-    
-    print("=" * 70)
-    print("TESTING ALL PERSONALITY TYPES")
-    print("=" * 70)
-    
-    results = []
-    
-    for user in data["users"]:
-        user_id = user["id"]
-        expected = user["expected_personality"]
-        description = user["description"]
-        conversation = user["conversation"]
-        test_message = user["test_message"]
-        
-        print(f"\n{'=' * 70}")
-        print(f"USER: {user_id}")
-        print(f"Description: {description}")
-        print(f"Expected Personality: {expected}")
-        print("=" * 70)
-        
         # Step 1: Extract memories
-        print("\n[1] Extracting memories...")
         try:
-            memories = extractor.extract(conversation)
-            pref_count = len(memories.get("preferences", []))
-            pattern_count = len(memories.get("emotional_patterns", []))
-            fact_count = len(memories.get("long_term_facts", []))
-            print(f"    Extracted: {pref_count} preferences, {pattern_count} patterns, {fact_count} facts")
+            memories = await extractor.aextract(user["conversation"])
         except Exception as e:
-            print(f"    Error extracting memories: {e}")
-            continue
-        
+            _discard(neutral_task, options)
+            # Counted as a miss so the accuracy covers every user
+            result = {
+                "user": user["id"],
+                "expected": user["expected_personality"],
+                "selected": None,
+                "match": False,
+                "neutral": None,
+                "styled": None,
+                "error": str(e)
+            }
+            report = render_user(user, None, None, None, None, error=e) if options["pretty"] else None
+            return result, report
+
         # Step 2: Classify personality
-        print("\n[2] Classifying personality...")
         selected = engine.select_personality(memories)
-        selected_config = engine.get_personality(selected)
-        
-        match = "✓ MATCH" if selected == expected else "✗ MISMATCH"
-        print(f"    Selected: {selected_config['name']} {match}")
-        
-        results.append({
-            "user": user_id,
-            "expected": expected,
+        result = {
+            "user": user["id"],
+            "expected": user["expected_personality"],
             "selected": selected,
-            "match": selected == expected
-        })
-        
+            "match": selected == user["expected_personality"]
+        }
+
         # Step 3: Generate response
-        print(f"\n[3] Test Message: \"{test_message}\"")
-        
-        # Neutral response
-        print("\n    [NEUTRAL]")
-        neutral = agent.respond(test_message, system_prompt=NEUTRAL_PROMPT)
-        # Truncate if too long
-        if len(neutral) > 300:
-            neutral = neutral[:300] + "..."
-        print(f"    {neutral}")
-        
-        # Personality response
-        prompt = engine.build_prompt(personality=selected, memory=memories)
-        print(f"\n    [{selected_config['name'].upper()}]")
-        styled = agent.respond(test_message, system_prompt=prompt)
-        print(f"    {styled}")
-    
+        error = None
+        if options["responses"]:
+            prompt = engine.build_prompt(personality=selected, memory=memories)
+            try:
+                styled = await _respond(agent, test_message, prompt, options)
+                neutral = await neutral_task if neutral_task is not None else None
+            except Exception as e:
+                # The classification still counts; the failure is recorded with it
+                neutral = styled = None
+                error = e
+                result["error"] = str(e)
+            finally:
+                _discard(neutral_task, options)
+
+    result["neutral"] = neutral
+    result["styled"] = styled
+    report = render_user(user, memories, selected, neutral, styled, error=error) if options["pretty"] else None
+    return result, report
+
+
+async def _warmup(extractor, agent):
+    """
+    Send one small request per client so connection setup and cold starts
+    happen before the users run.
+
+    The replies are thrown away, so a failed warm-up is only logged; the
+    users' own requests retry and report errors as usual.
+    """
+    results = await asyncio.gather(
+        agent.arespond("hi", system_prompt=NEUTRAL_PROMPT, max_tokens=WARMUP_MAX_TOKENS),
+        extractor.aextract([{"turn": 1, "role": "user", "content": "hi"}]),
+        return_exceptions=True
+    )
+    for name, result in zip(("agent", "extractor"), results):
+        if isinstance(result, Exception):
+            print(f"Warm-up request for the {name} failed: {result}")
+
+
+async def _run_all(users, extractor, engine, agent, http_client, options):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    try:
+        if options["warmup"]:
+            await _warmup(extractor, agent)
+        return await asyncio.gather(*(
+            _run_user(user, extractor, engine, agent, semaphore, options) for user in users
+        ))
+    finally:
+        # Shared response tasks nobody awaited (their users' extraction failed)
+        # are finished here, before the clients close, so their errors are retrieved
+        if options["response_cache"]:
+            await asyncio.gather(*options["response_cache"].values(), return_exceptions=True)
+        await extractor.aclose()
+        await agent.aclose()
+        await http_client.aclose()
+
+
+def run_test(use_cache=True, neutral=True, responses=True, cache_responses=False, warmup=False,
+             pretty=False, results_path=RESULTS_PATH):
+    """
+    Test all personality types with different user profiles.
+
+    With use_cache, the extractor reuses per-chunk results from .cache/extract
+    for requests (chunk, prompts and settings) seen on an earlier run. neutral
+    and responses control the LLM replies generated for comparison; with
+    responses=False only classification is checked, so no calls are made
+    after extraction. With cache_responses, users that would send the same
+    (system prompt, message) share one response; at temperature 0.7 that
+    reuses one sample instead of drawing a fresh one.
+    """
+    options = {
+        "neutral": neutral and responses,
+        "responses": responses,
+        "response_cache": {} if cache_responses else None,
+        "warmup": warmup,
+        "pretty": pretty,
+    }
+
+    # Load test users
+    with open(TEST_USERS_PATH, "rb") as f:
+        data = orjson.loads(f.read())
+
+    import httpx
+    from memory_extractor import MemoryExtractor
+    from base_agent import BaseAgent
+
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    )
+    extractor = MemoryExtractor(
+        chunk_size=10,
+        temperature=0.0,
+        async_http_client=http_client,
+        cache_dir=EXTRACT_CACHE_DIR if use_cache else None
+    )
+    engine = PersonalityEngine()
+    agent = BaseAgent(temperature=0.7, async_http_client=http_client)
+
+    print("=" * 70)
+    print("TESTING ALL PERSONALITY TYPES")
+    print("=" * 70)
+
+    # All users run concurrently; reports are printed in the original user order
+    outcomes = run_async(_run_all(data["users"], extractor, engine, agent, http_client, options))
+
+    # One pass writes the JSONL records and tallies the summary
+    matches = 0
+    with open(results_path, "wb") as fout:
+        for result, report in outcomes:
+            fout.write(orjson.dumps(result) + b"\n")
+            matches += result["match"]
+            if report is not None:
+                sys.stdout.write(report)
+    total = len(outcomes)
+
     # Summary
     print("\n" + "=" * 70)
     print("SUMMARY")
     print("=" * 70)
-    
-    matches = sum(1 for r in results if r["match"])
-    total = len(results)
-    
+
     print(f"\nClassification Accuracy: {matches}/{total}")
     print()
-    
-    for r in results:
+
+    for r, _ in outcomes:
         status = "✓" if r["match"] else "✗"
-        print(f"  {status} {r['user']}: expected {r['expected']}, got {r['selected']}")
-    
+        if r["selected"] is None:
+            print(f"  {status} {r['user']}: expected {r['expected']}, extraction failed")
+        elif "error" in r:
+            print(f"  {status} {r['user']}: expected {r['expected']}, got {r['selected']} (responses failed)")
+        else:
+            print(f"  {status} {r['user']}: expected {r['expected']}, got {r['selected']}")
+
+    print(f"\nResults written to {results_path}")
     print("\n" + "=" * 70)
     print("Test complete.")
     print("=" * 70)
 
 
+def list_users():
+    """Print each test user's id, expected personality and description."""
+    with open(TEST_USERS_PATH, "rb") as f:
+        users = orjson.loads(f.read())["users"]
+    for user in users:
+        print(f"{user['id']}: {user['expected_personality']} - {user['description']}")
+
+
 if __name__ == "__main__":
-    run_test()
+    parser = argparse.ArgumentParser(description="Test personality selection for all test users")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-extract every user's memories instead of reusing .cache/extract"
+    )
+    parser.add_argument(
+        "--no-neutral",
+        action="store_true",
+        help="Skip the neutral comparison response"
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Only check classification; generate no responses"
+    )
+    parser.add_argument(
+        "--cache-responses",
+        action="store_true",
+        help="Reuse one response for users sending the same message under the same prompt"
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="Send a short request and a one-turn extraction before testing users"
+    )
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Also print each user's memories, classification and responses"
+    )
+    parser.add_argument(
+        "--results",
+        default=RESULTS_PATH,
+        help="JSONL file for per-user results (default: results.jsonl)"
+    )
+    parser.add_argument(
+        "--list-users",
+        action="store_true",
+        help="List the test users and exit without calling the LLM"
+    )
+    args = parser.parse_args()
+
+    if args.list_users:
+        list_users()
+        sys.exit(0)
+
+    run_test(
+        use_cache=not args.no_cache,
+        neutral=not args.no_neutral,
+        responses=not args.fast,
+        cache_responses=args.cache_responses,
+        warmup=args.warmup,
+        pretty=args.pretty,
+        results_path=args.results
+    )
 
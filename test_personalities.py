@@ -0,0 +1,40 @@
+"""
+Personality Selection Tests
+
+pytest version of test_all_personalities.py: one test per test user, so
+users report pass/fail separately and can run in parallel with
+pytest-xdist (pytest -n auto). Skipped without GROQ_API_KEY.
+"""
+
+import os
+
+import orjson
+import pytest
+
+from memory_extractor import MemoryExtractor
+from personality_engine import PersonalityEngine
+
+TEST_USERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "test_users.json")
+
+with open(TEST_USERS_PATH, "rb") as f:
+    TEST_USERS = orjson.loads(f.read())["users"]
+
+
+@pytest.fixture(scope="session")
+def extractor():
+    if not os.getenv("GROQ_API_KEY"):
+        pytest.skip("GROQ_API_KEY not set")
+    extractor = MemoryExtractor(chunk_size=10, temperature=0.0)
+    yield extractor
+    extractor.close()
+
+
+@pytest.fixture(scope="session")
+def engine():
+    return PersonalityEngine()
+
+
+@pytest.mark.parametrize("user", TEST_USERS, ids=[user["id"] for user in TEST_USERS])
+def test_user_personality(user, extractor, engine):
+    memories = extractor.extract(user["conversation"])
+    assert engine.select_personality(memories) == user["expected_personality"]